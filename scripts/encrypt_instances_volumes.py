@@ -1,381 +1,798 @@
 # -*- coding: utf-8 -*-
-# pylint: disable=W1203
 # pylint: disable=W0718
 # pylint: disable=C0301
 """This script encrypts all unencrypted EBS volumes for all EC2 instances."""
 import argparse
 import configparser
-import logging
+import logging.handlers
 import os
+import queue
+import random
+import threading
 import time
+from collections import defaultdict
+from concurrent.futures import as_completed
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import Dict
+from typing import Iterator
 from typing import List
+from typing import NamedTuple
 from typing import Optional
+from typing import Set
 from typing import Tuple
 
 import boto3
 import botocore.exceptions
+from botocore.config import Config
+from botocore.waiter import Waiter
 
+# Largest page DescribeVolumes returns, to list volumes in as few calls as possible
+VOLUME_PAGE_SIZE = 500
 
-def setup_logging(log_file: str, log_dir: str) -> logging.Logger:
+# DescribeInstances accepts a bounded number of filter values per request
+INSTANCE_BATCH_SIZE = 100
+
+# DescribeAutoScalingInstances accepts at most 50 instance IDs per request
+AUTO_SCALING_BATCH_SIZE = 50
+
+# Number of volumes of an instance encrypted concurrently
+MAX_VOLUME_WORKERS = 5
+
+# Number of Availability Zones listed concurrently by gather_unencrypted_info,
+# enough for a region with opted-in Local Zones or Wavelength Zones
+MAX_ZONE_WORKERS = 16
+
+# Number of instances encrypted concurrently unless --workers says otherwise, each
+# of them being stopped for the time of its encryption
+DEFAULT_INSTANCE_WORKERS = 4
+
+# Polling of the waiters, see wait_with_backoff: "Delay" is the longest pause
+# between two polls. Volumes and instances settle within seconds to minutes, while
+# snapshots of large volumes can take well over an hour to complete.
+VOLUME_WAITER_CONFIG = {"Delay": 3, "MaxAttempts": 200}
+INSTANCE_WAITER_CONFIG = {"Delay": 5, "MaxAttempts": 120}
+SNAPSHOT_WAITER_CONFIG = {"Delay": 30, "MaxAttempts": 480}
+
+# Client-side rate limiting so that concurrent pipelines back off on throttling
+# rather than fail. A client is shared by at most MAX_VOLUME_WORKERS volume
+# pipelines (each worker thread of main has its own client, see
+# _get_thread_client, so --workers does not matter) or MAX_ZONE_WORKERS zone
+# shards, the connection pool is sized for the larger of the two.
+BOTO_CONFIG = Config(
+    retries={"mode": "adaptive", "max_attempts": 20},
+    max_pool_connections=max(MAX_VOLUME_WORKERS, MAX_ZONE_WORKERS),
+    tcp_keepalive=True,
+    connect_timeout=10,
+    read_timeout=70,
+)
+
+# Per worker thread boto3 session objects, see _get_thread_client
+_thread_local = threading.local()
+
+
+class UnencryptedVolume(NamedTuple):
+    """An unencrypted volume, as gathered by gather_unencrypted_info."""
+
+    volume_id: str
+    name: str
+    size: int
+
+
+class UnencryptedInstance(NamedTuple):
+    """An instance and its unencrypted volumes, as gathered by gather_unencrypted_info."""
+
+    instance_id: str
+    name: str
+    volumes: Tuple[UnencryptedVolume, ...]
+
+
+def setup_logging(
+    log_file: str, log_dir: str
+) -> Tuple[logging.Logger, logging.handlers.QueueListener]:
     """
     Set up logging.
 
+    The worker threads only put their records on a queue, a listener thread
+    writes them to the log file, so that logging does not serialize the threads
+    on the file handler.
+
     Args:
         log_file: The file to write the logs to.
         log_dir: The directory to create the log file in.
 
     Returns:
-        The logger object.
+        The logger object and the started queue listener, to stop once done.
     """
     # Create the log directory if it doesn't exist
     os.makedirs(log_dir, exist_ok=True)
 
-    logging.basicConfig(
-        level=logging.INFO,
-        filename=os.path.join(log_dir, log_file),
-        filemode="a",
-        format="%(asctime)s - %(levelname)s - %(message)s",
+    file_handler = logging.FileHandler(os.path.join(log_dir, log_file), mode="a")
+    file_handler.setFormatter(
+        logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
     )
 
+    log_queue: queue.Queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.INFO)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
     logging.getLogger("boto3").setLevel(logging.WARNING)
     logging.getLogger("botocore").setLevel(logging.WARNING)
 
-    return logging.getLogger(__name__)
+    return logging.getLogger(__name__), listener
 
 
-def get_instance_name(instance: boto3.resource("ec2").Instance) -> Optional[str]:
+def _get_name_tag(tags: Optional[List[Dict[str, str]]], default: str) -> str:
+    """
+    Extract the value of the Name tag in a single pass over the tags.
+
+    Args:
+        tags: The tags of the resource, as returned by the EC2 API.
+        default: The value to return if there is no Name tag.
+
+    Returns:
+        The value of the Name tag, or default.
+    """
+    return next((tag["Value"] for tag in tags or [] if tag["Key"] == "Name"), default)
+
+
+def get_instance_name(tags: Optional[List[Dict[str, str]]]) -> str:
     """
     Extract name from instance tags.
 
     Args:
-        instance: The EC2 instance.
+        tags: The tags of the EC2 instance, as returned by the EC2 API.
 
     Returns:
         The name of the instance, or Name Unknown if no name is found.
     """
-    for tag in instance.tags or []:
-        if tag["Key"] == "Name":
-            return tag["Value"]
-    return "Name Unknown"
+    return _get_name_tag(tags, "Name Unknown")
 
 
-def get_volume_name(volume: 'boto3.resource("ec2").Volume') -> Optional[str]:
+def get_volume_name(tags: Optional[List[Dict[str, str]]]) -> str:
     """
     Extract the name from the volume tags.
 
     Args:
-        volume: The boto3 Volume object.
+        tags: The tags of the EBS volume, as returned by the EC2 API.
 
     Returns:
         The name of the volume if found in the tags, otherwise Name Unknown.
     """
-    for tag in volume.tags or []:
-        if tag["Key"] == "Name":
-            return tag["Value"]
-    return "Unknown Name"
+    return _get_name_tag(tags, "Unknown Name")
+
+
+def _describe_volumes(
+    ec2_client: boto3.client, filters: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    List the volumes matching the filters with the DescribeVolumes paginator.
+
+    Args:
+        ec2_client: The boto3 EC2 client object.
+        filters: The DescribeVolumes filters.
+
+    Returns:
+        The volumes, as returned by DescribeVolumes.
+    """
+    return [
+        volume
+        for page in ec2_client.get_paginator("describe_volumes").paginate(
+            Filters=filters, PaginationConfig={"PageSize": VOLUME_PAGE_SIZE}
+        )
+        for volume in page["Volumes"]
+    ]
 
 
 def gather_unencrypted_info(
-    ec2: boto3.resource,
-) -> List[Tuple[str, str, List[Tuple[str, str, int]]]]:
+    ec2_client: boto3.client,
+    instance_ids: Optional[List[str]] = None,
+) -> Iterator[UnencryptedInstance]:
     """
     Gather information about instances and their unencrypted volumes.
 
+    Unencrypted in-use volumes are listed once for the whole account with the
+    DescribeVolumes paginator, VOLUME_PAGE_SIZE per page, and grouped by the
+    instance they are attached to. Unless instance_ids is given, the listing is split by
+    Availability Zone so that the pages of every zone are fetched in parallel.
+    Instance names are then resolved in batches of INSTANCE_BATCH_SIZE IDs per
+    DescribeInstances call, and the instances of a batch are yielded as soon as
+    it is resolved. It takes the low-level client so that no attribute of
+    a resource object is lazily loaded.
+
     Args:
-        ec2: The boto3 EC2 resource object.
+        ec2_client: The boto3 EC2 client object.
+        instance_ids: If given, only the volumes attached to these instances are
+                      listed, otherwise the volumes of all instances are.
 
-    Returns:
-        A list of tuples, where each tuple contains the instance ID, the instance name,
-        and a list of tuples with volume ID, volume name and volume size for unencrypted volumes attached to the instance.
+    Yields:
+        The instances, each with its name and its unencrypted volumes with their
+        ID, name and size.
     """
-    unencrypted_info = []
-    for instance in ec2.instances.all():
-        unencrypted_volumes = []
+    # Only unencrypted attached volumes are relevant, let the API drop the others
+    filters = [
+        {"Name": "encrypted", "Values": ["false"]},
+        {"Name": "status", "Values": ["in-use"]},
+    ]
+    if instance_ids:
+        filters.append({"Name": "attachment.instance-id", "Values": instance_ids})
+        volumes = _describe_volumes(ec2_client, filters)
+    else:
+        # Zones of every state, volumes of an impaired or unavailable zone still
+        # have to be listed
+        zones = [
+            zone["ZoneName"]
+            for zone in ec2_client.describe_availability_zones()["AvailabilityZones"]
+        ]
+        # Each zone is a disjoint shard of the volumes, clients are thread-safe. No
+        # more threads than the client has connections, see MAX_ZONE_WORKERS.
+        zone_workers = min(len(zones), ec2_client.meta.config.max_pool_connections)
+        with ThreadPoolExecutor(max_workers=max(1, zone_workers)) as executor:
+            volumes = [
+                volume
+                for zone_volumes in executor.map(
+                    lambda zone: _describe_volumes(
+                        ec2_client,
+                        filters + [{"Name": "availability-zone", "Values": [zone]}],
+                    ),
+                    zones,
+                )
+                for volume in zone_volumes
+            ]
+
+    volumes_by_instance = defaultdict(list)
+    for volume in volumes:
+        volume_name = get_volume_name(volume.get("Tags"))
+        volumes_by_instance[volume["Attachments"][0]["InstanceId"]].append(
+            UnencryptedVolume(volume["VolumeId"], volume_name, volume["Size"])
+        )
 
-        for volume in instance.volumes.all():
-            if not volume.encrypted:
-                volume_name = get_volume_name(volume)
-                unencrypted_volumes.append((volume.id, volume_name, volume.size))
+    attached_instance_ids = list(volumes_by_instance)
+    paginator = ec2_client.get_paginator("describe_instances")
+    for start in range(0, len(attached_instance_ids), INSTANCE_BATCH_SIZE):
+        chunk = attached_instance_ids[start : start + INSTANCE_BATCH_SIZE]
+        instance_names = {}
+        # A filter, unlike InstanceIds, does not fail when an instance disappeared
+        for page in paginator.paginate(
+            Filters=[{"Name": "instance-id", "Values": chunk}]
+        ):
+            for reservation in page["Reservations"]:
+                for instance in reservation["Instances"]:
+                    instance_names[instance["InstanceId"]] = get_instance_name(
+                        instance.get("Tags")
+                    )
+
+        for instance_id in chunk:
+            yield UnencryptedInstance(
+                instance_id,
+                instance_names.get(instance_id, "Name Unknown"),
+                tuple(volumes_by_instance.pop(instance_id)),
+            )
 
-        if unencrypted_volumes:
-            instance_name = get_instance_name(instance)
-            unencrypted_info.append((instance.id, instance_name, unencrypted_volumes))
 
-    return unencrypted_info
+def _get_instance_states(
+    ec2_client: boto3.client, instance_ids: List[str]
+) -> Dict[str, str]:
+    """
+    Get the state of instances, INSTANCE_BATCH_SIZE IDs per DescribeInstances call.
 
+    Args:
+        ec2_client: The boto3 EC2 client object.
+        instance_ids: The IDs of the instances.
 
-def is_part_of_auto_scaling_group(instance_id: str, autoscaling) -> bool:
+    Returns:
+        The state name of each instance found, by instance ID.
     """
-    Check if an instance is part of an Auto Scaling group.
+    states = {}
+    paginator = ec2_client.get_paginator("describe_instances")
+    for start in range(0, len(instance_ids), INSTANCE_BATCH_SIZE):
+        chunk = instance_ids[start : start + INSTANCE_BATCH_SIZE]
+        # A filter, unlike InstanceIds, does not fail when an instance disappeared
+        for page in paginator.paginate(
+            Filters=[{"Name": "instance-id", "Values": chunk}]
+        ):
+            for reservation in page["Reservations"]:
+                for instance in reservation["Instances"]:
+                    states[instance["InstanceId"]] = instance["State"]["Name"]
+    return states
+
+
+def get_auto_scaling_instance_ids(instance_ids: List[str], autoscaling) -> Set[str]:
+    """
+    Find which of the given instances are part of an Auto Scaling group.
+
+    The instances are looked up AUTO_SCALING_BATCH_SIZE IDs per
+    DescribeAutoScalingInstances call.
 
     Args:
-        instance_id: The ID of the instance.
+        instance_ids: The IDs of the instances.
         autoscaling: The boto3 AutoScaling client object.
 
     Returns:
-        True if the instance is part of an Auto Scaling group, False otherwise.
+        The IDs of the instances that are part of an Auto Scaling group.
     """
-    try:
-        response = autoscaling.describe_auto_scaling_instances(
-            InstanceIds=[instance_id]
-        )
-        return bool(response["AutoScalingInstances"])
-    except botocore.exceptions.ClientError as error:
-        logging.error(
-            f"Failed to get Auto Scaling group for instance {instance_id}. Error: {error}"
-        )
-        return False
+    auto_scaling_instance_ids = set()
+    paginator = autoscaling.get_paginator("describe_auto_scaling_instances")
+    for start in range(0, len(instance_ids), AUTO_SCALING_BATCH_SIZE):
+        chunk = instance_ids[start : start + AUTO_SCALING_BATCH_SIZE]
+        try:
+            for page in paginator.paginate(InstanceIds=chunk):
+                auto_scaling_instance_ids.update(
+                    instance["InstanceId"] for instance in page["AutoScalingInstances"]
+                )
+        except botocore.exceptions.ClientError as error:
+            logging.error(
+                "Failed to get Auto Scaling group for instances %s. Error: %s",
+                ", ".join(chunk),
+                error,
+            )
+    return auto_scaling_instance_ids
 
 
-def encrypt_volumes(
+def wait_with_backoff(
+    waiter: Waiter, waiter_config: Dict[str, int], **kwargs: Any
+) -> None:
+    """
+    Wait for the condition of a waiter, polling with exponential backoff.
+
+    The first polls are about a second apart so that fast transitions are noticed
+    right away, then the delay grows up to waiter_config["Delay"] seconds so that
+    long operations do not flood the API. A random jitter keeps concurrent
+    pipelines from polling in lockstep.
+
+    Args:
+        waiter: The boto3 client waiter.
+        waiter_config: The longest delay between two polls ("Delay") and the
+                       maximum number of polls ("MaxAttempts").
+        **kwargs: The parameters of the waiter operation, e.g. VolumeIds.
+
+    Returns:
+        None
+    """
+    max_attempts = waiter_config["MaxAttempts"]
+    for attempt in range(1, max_attempts + 1):
+        try:
+            waiter.wait(WaiterConfig={"MaxAttempts": 1}, **kwargs)
+            return
+        except botocore.exceptions.WaiterError as error:
+            # Anything but an unmet condition (e.g. a failure state) is final. The
+            # reason goes on with "Previously accepted state: ..." when a retry
+            # acceptor matched, such as InvalidInstanceID.NotFound.
+            if (
+                not error.kwargs.get("reason", "").startswith("Max attempts exceeded")
+                or attempt == max_attempts
+            ):
+                raise
+        delay = min(waiter_config["Delay"], 1 + (attempt * 0.3) ** 2)
+        time.sleep(delay + random.uniform(0, 1))
+
+
+def _encrypt_volume(
+    volume: Dict[str, Any],
     instance_id: str,
-    ec2: boto3.resource,
+    instance_name: str,
+    availability_zone: str,
     ec2_client: boto3.client,
-    autoscaling: boto3.client,
+    waiters: Dict[str, Waiter],
     kms_key_id: str,
     logger: logging.Logger,
-) -> None:
+) -> Tuple[str, str]:
     """
-    Encrypt all volumes associated with an instance.
+    Replace one unencrypted volume of a stopped instance with an encrypted copy.
+
+    The encrypted volume is created straight from a snapshot of the unencrypted
+    volume, without an encrypted copy of the snapshot in between.
 
     Args:
-        instance_id: The ID of the instance.
-        ec2: The boto3 EC2 resource object.
+        volume: The unencrypted volume, as returned by DescribeVolumes.
+        instance_id: The ID of the instance the volume is attached to.
+        instance_name: The name of the instance.
+        availability_zone: The Availability Zone of the instance.
+        ec2_client: The boto3 EC2 client object.
+        waiters: The EC2 client waiters, by waiter name.
         kms_key_id: The ID of the KMS key to use for encryption.
         logger: The logger object.
 
     Returns:
-        None
+        A tuple with the summary lines for the unencrypted volume and for the new
+        encrypted volume.
     """
-    instance = ec2.Instance(instance_id)
-    instance_name = get_instance_name(instance)
-    total_unencrypted_volumes = 0
-    unencrypted_volumes_info = []
-    encrypted_volumes_info = []
+    volume_id = volume["VolumeId"]
+    volume_name = get_volume_name(volume.get("Tags"))
 
-    logger.info("#" * 45)
-    logger.info("#         Processing the request...")
-    logger.info("#" * 45)
+    logger.info(
+        "2. Creating snapshot of volume %s (%s) of instance %s...",
+        volume_id,
+        volume_name,
+        instance_id,
+    )
+    snapshot_id = ec2_client.create_snapshot(
+        VolumeId=volume_id,
+        Description="Created by SecureTheCloud script",
+        TagSpecifications=[
+            {
+                "ResourceType": "snapshot",
+                "Tags": [
+                    {
+                        "Key": "Name",
+                        "Value": f"Snapshot for volume {volume_id} ({volume_name})",
+                    },
+                ],
+            },
+        ],
+    )["SnapshotId"]
+    wait_with_backoff(
+        waiters["snapshot_completed"],
+        SNAPSHOT_WAITER_CONFIG,
+        SnapshotIds=[snapshot_id],
+    )
+    logger.info(
+        "Snapshot %s created for volume %s of instance %s.",
+        snapshot_id,
+        volume_id,
+        instance_id,
+    )
 
-    if is_part_of_auto_scaling_group(instance_id, autoscaling):
-        logger.warning(
-            f"Instance {instance.id} ({instance_name}) is part of an Auto Scaling group. Skipping..."
+    # Keep the performance settings of the original volume
+    volume_settings = {"VolumeType": volume["VolumeType"]}
+    if volume["VolumeType"] in ("io1", "io2", "gp3"):
+        volume_settings["Iops"] = volume["Iops"]
+    if volume["VolumeType"] == "gp3":
+        volume_settings["Throughput"] = volume["Throughput"]
+
+    # The volume is encrypted while it is created from the unencrypted snapshot, and
+    # the snapshot is only needed until then, delete it whether this succeeded or not.
+    # This is the first use of the KMS key, so it happens while the original volume
+    # is still attached: a failure leaves the instance untouched.
+    logger.info(
+        "3. Creating volume from snapshot %s of volume %s of instance %s and encrypting it with KMS key (%s)...",
+        snapshot_id,
+        volume_id,
+        instance_id,
+        kms_key_id,
+    )
+    try:
+        encrypted_volume_id = ec2_client.create_volume(
+            AvailabilityZone=availability_zone,
+            SnapshotId=snapshot_id,
+            KmsKeyId=kms_key_id,
+            Encrypted=True,
+            **volume_settings,
+        )["VolumeId"]
+
+        wait_with_backoff(
+            waiters["volume_available"],
+            VOLUME_WAITER_CONFIG,
+            VolumeIds=[encrypted_volume_id],
         )
-        return
-
-    if instance.instance_lifecycle == "spot":
-        logger.warning(
-            f"Instance {instance.id} ({instance_name}) is a Spot Instance. Skipping..."
+    finally:
+        ec2_client.delete_snapshot(SnapshotId=snapshot_id)
+        logger.info(
+            "Unencrypted snapshot previously created for volume %s (%s) of instance %s: %s has been deleted.",
+            volume_id,
+            volume_name,
+            instance_id,
+            snapshot_id,
         )
-        return
 
     logger.info(
-        f"Encrypting volume(s) attached to instance {instance.id} ({instance_name})..."
+        "Encrypted volume %s created for volume %s of instance %s.",
+        encrypted_volume_id,
+        volume_id,
+        instance_id,
     )
 
-    start_time = time.time()
-
-    if instance.state["Name"] != "stopped":
-        logger.info(f"1. Stopping instance {instance.id} ({instance_name})...")
-        instance.stop()
-        instance.wait_until_stopped()
-        logger.info(f"Instance {instance.id} stopped.")
-
-    else:
-        logger.info(f"1. Instance {instance.id} ({instance_name}) already stopped.")
-
-    for volume in instance.volumes.all():
-        volume_name = get_volume_name(volume)
-
-        if not volume.encrypted:
-            total_unencrypted_volumes += 1
-            unencrypted_volumes_info.append(
-                f"{volume.id} ({volume_name}) - {volume.size}GB"
-            )
-
-            logger.info(
-                f"2. Creating snapshot of volume {volume.id} ({volume_name})..."
-            )
-            snapshot = ec2.create_snapshot(
-                VolumeId=volume.id,
-                Description="Created by SecureTheCloud script",
-                TagSpecifications=[
-                    {
-                        "ResourceType": "snapshot",
-                        "Tags": [
-                            {
-                                "Key": "Name",
-                                "Value": f"Snapshot for volume {volume.id} ({volume_name})",
-                            },
-                        ],
-                    },
-                ],
-            )
-            snapshot.wait_until_completed()
-            logger.info(f"Snapshot created: {snapshot.snapshot_id}.")
+    # Only detach the original volume once its replacement is available
+    logger.info(
+        "4. Detaching volume %s (%s) from instance %s (%s)...",
+        volume_id,
+        volume_name,
+        instance_id,
+        instance_name,
+    )
 
-            logger.info(
-                f"3. Copying snapshot {snapshot.snapshot_id} and encrypting it with KMS key ({kms_key_id})..."
-            )
-            encrypted_snapshot = ec2.Snapshot(
-                snapshot.copy(
-                    SourceRegion=instance.placement["AvailabilityZone"][:-1],
-                    Encrypted=True,
-                    KmsKeyId=kms_key_id,
-                    Description="Encrypted snapshot created by SecureTheCloud script",
-                    TagSpecifications=[
-                        {
-                            "ResourceType": "snapshot",
-                            "Tags": [
-                                {
-                                    "Key": "Name",
-                                    "Value": f"Encrypted Snapshot for volume {volume.id} ({volume_name})",
-                                },
-                            ],
-                        },
-                    ],
-                )["SnapshotId"]
-            )
+    # Capture the original device name and "Delete on Termination" value
+    attachment = volume["Attachments"][0]
+    device_name = attachment["Device"]
+    delete_on_termination = attachment["DeleteOnTermination"]
 
-            encrypted_snapshot.wait_until_completed()
-            logger.info(
-                f"Encrypted snapshot created for volume {volume.id} ({volume_name}): {encrypted_snapshot.snapshot_id}."
-            )
+    ec2_client.detach_volume(
+        VolumeId=volume_id,
+        Device=device_name,
+        InstanceId=instance_id,
+        Force=True,
+    )
+    wait_with_backoff(
+        waiters["volume_available"],
+        VOLUME_WAITER_CONFIG,
+        VolumeIds=[volume_id],
+    )
 
-            logger.info(
-                f"Enabling Fast Snapshot Restore on {encrypted_snapshot.snapshot_id}..."
-            )
+    logger.info("Volume %s detached from instance %s.", volume_id, instance_id)
 
-            ec2_client.enable_fast_snapshot_restores(
-                AvailabilityZones=[instance.placement["AvailabilityZone"]],
-                SourceSnapshotIds=[encrypted_snapshot.snapshot_id],
-            )
+    tags = [
+        {"Key": tag["Key"], "Value": tag["Value"]} for tag in volume.get("Tags", [])
+    ]
+    if tags:
+        ec2_client.create_tags(Resources=[encrypted_volume_id], Tags=tags)
 
-            snapshot.delete()
-            logger.info(
-                f"Unencrypted snapshot previously created for volume {volume.id} ({volume_name}): {snapshot.snapshot_id} has been deleted."
-            )
+    logger.info(
+        "5. Copied existing tags from unencrypted volume %s (%s) to new encrypted volume %s of instance %s.",
+        volume_id,
+        volume_name,
+        encrypted_volume_id,
+        instance_id,
+    )
+    logger.info(
+        "6. Attaching new encrypted volume %s (replacing %s) to instance %s (%s)...",
+        encrypted_volume_id,
+        volume_id,
+        instance_id,
+        instance_name,
+    )
+    ec2_client.attach_volume(
+        Device=device_name,
+        InstanceId=instance_id,
+        VolumeId=encrypted_volume_id,
+    )
+    wait_with_backoff(
+        waiters["volume_in_use"],
+        VOLUME_WAITER_CONFIG,
+        VolumeIds=[encrypted_volume_id],
+    )
 
-            logger.info(
-                f"4. Detaching volume {volume.id} ({volume_name}) from instance {instance.id} ({instance_name})..."
-            )
+    ec2_client.modify_instance_attribute(
+        InstanceId=instance_id,
+        BlockDeviceMappings=[
+            {
+                "DeviceName": device_name,
+                "Ebs": {"DeleteOnTermination": delete_on_termination},
+            },
+        ],
+    )
 
-            device_name = (
-                volume.attachments[0]["Device"] if volume.attachments else None
-            )
+    logger.info(
+        "Volume %s attached to instance %s in place of volume %s.",
+        encrypted_volume_id,
+        instance_id,
+        volume_id,
+    )
 
-            # Capture the original "Delete on Termination" value
-            delete_on_termination = (
-                volume.attachments[0]["DeleteOnTermination"]
-                if volume.attachments
-                else False
-            )
+    return (
+        f"{volume_id} ({volume_name}) - {volume['Size']}GB",
+        f"{encrypted_volume_id} from snapshot {snapshot_id}",
+    )
 
-            volume.detach_from_instance(
-                Device=device_name,
-                InstanceId=instance_id,
-                Force=True,
-            )
-            waiter = ec2.meta.client.get_waiter("volume_available")
-            waiter.wait(VolumeIds=[volume.id])
 
-            logger.info(f"Volume {volume.id} detached.")
+def encrypt_volumes(
+    instance_id: str,
+    ec2_client: boto3.client,
+    kms_key_id: str,
+    logger: logging.Logger,
+) -> bool:
+    """
+    Encrypt all volumes associated with an instance.
 
-            logger.info(
-                f"5. Creating encrypted volume from snapshot {encrypted_snapshot.snapshot_id}..."
-            )
-            encrypted_volume = ec2.create_volume(
-                AvailabilityZone=volume.availability_zone,
-                SnapshotId=encrypted_snapshot.snapshot_id,
-                KmsKeyId=kms_key_id,
-                Encrypted=True,
-            )
+    Args:
+        instance_id: The ID of the instance.
+        ec2_client: The boto3 EC2 client object.
+        kms_key_id: The ID of the KMS key to use for encryption.
+        logger: The logger object.
 
-            waiter = ec2_client.get_waiter("volume_available")
-            waiter.wait(VolumeIds=[encrypted_volume.id])
+    Returns:
+        Whether the instance was started again, False if it was skipped.
+    """
+    # Describe the instance once, its attributes are all read from this response
+    response = ec2_client.describe_instances(InstanceIds=[instance_id])
+    instance = response["Reservations"][0]["Instances"][0]
+    instance_name = get_instance_name(instance.get("Tags"))
+    availability_zone = instance["Placement"]["AvailabilityZone"]
+    unencrypted_volumes_info = []
+    encrypted_volumes_info = []
 
-            encrypted_volumes_info.append(
-                f"{encrypted_volume.id} from snapshot {encrypted_snapshot.id}"
-            )
-            logger.info(f"Encrypted volume {encrypted_volume.id} created.")
+    logger.info("#" * 45)
+    logger.info("#         Processing instance %s...", instance_id)
+    logger.info("#" * 45)
 
-            logger.info(f"Disabling Fast Snapshot Restore on {snapshot.snapshot_id}...")
+    if instance.get("InstanceLifecycle") == "spot":
+        logger.warning(
+            "Instance %s (%s) is a Spot Instance. Skipping...",
+            instance_id,
+            instance_name,
+        )
+        return False
 
-            ec2_client.disable_fast_snapshot_restores(
-                AvailabilityZones=[instance.placement["AvailabilityZone"]],
-                SourceSnapshotIds=[encrypted_snapshot.snapshot_id],
-            )
+    logger.info(
+        "Encrypting volume(s) attached to instance %s (%s)...",
+        instance_id,
+        instance_name,
+    )
 
-            tags = (
-                [{"Key": tag["Key"], "Value": tag["Value"]} for tag in volume.tags]
-                if volume.tags
-                else []
-            )
-            if tags:
-                encrypted_volume.create_tags(Tags=tags)
+    start_time = time.time()
 
-            logger.info(
-                f"6. Copied existing tags from unencrypted volume {volume.id} ({volume_name}) to new encrypted volume {encrypted_volume.id}."
-            )
-            logger.info(
-                f"7. Attaching new encrypted volume {encrypted_volume.id} to instance {instance.id} ({instance_name})..."
-            )
-            encrypted_volume.attach_to_instance(
-                Device=device_name,
-                InstanceId=instance_id,
-            )
-            waiter = ec2_client.get_waiter("volume_in_use")
-            waiter.wait(VolumeIds=[encrypted_volume.id])
+    # Build the waiters once, they are shared with all the volume pipelines
+    waiters = {
+        waiter_name: ec2_client.get_waiter(waiter_name)
+        for waiter_name in (
+            "instance_stopped",
+            "snapshot_completed",
+            "volume_available",
+            "volume_in_use",
+        )
+    }
+
+    if instance["State"]["Name"] != "stopped":
+        logger.info("1. Stopping instance %s (%s)...", instance_id, instance_name)
+        ec2_client.stop_instances(InstanceIds=[instance_id])
+        wait_with_backoff(
+            waiters["instance_stopped"],
+            INSTANCE_WAITER_CONFIG,
+            InstanceIds=[instance_id],
+        )
+        logger.info("Instance %s stopped.", instance_id)
 
-            instance.modify_attribute(
-                BlockDeviceMappings=[
-                    {
-                        "DeviceName": device_name,
-                        "Ebs": {"DeleteOnTermination": delete_on_termination},
-                    },
-                ]
-            )
+    else:
+        logger.info("1. Instance %s (%s) already stopped.", instance_id, instance_name)
 
-            logger.info(
-                f"Volume {encrypted_volume.id} attached to instance {instance.id}."
-            )
+    # List the attached volumes once
+    volumes = _describe_volumes(
+        ec2_client, [{"Name": "attachment.instance-id", "Values": [instance_id]}]
+    )
+    unencrypted_volumes = [volume for volume in volumes if not volume["Encrypted"]]
+    failed_volumes = []
+    total_volumes_size = 0
+
+    # Run the per-volume pipelines concurrently so that their waiters overlap, with
+    # no more threads than volumes. The summary lines are collected here from the
+    # results, so the pipelines share no mutable state.
+    volume_workers = max(1, min(len(unencrypted_volumes), MAX_VOLUME_WORKERS))
+    with ThreadPoolExecutor(max_workers=volume_workers) as executor:
+        futures = {
+            executor.submit(
+                _encrypt_volume,
+                volume,
+                instance_id,
+                instance_name,
+                availability_zone,
+                ec2_client,
+                waiters,
+                kms_key_id,
+                logger,
+            ): volume
+            for volume in unencrypted_volumes
+        }
+        for future in as_completed(futures):
+            volume = futures[future]
+            try:
+                unencrypted_volume_info, encrypted_volume_info = future.result()
+            except Exception as error:
+                logger.error(
+                    "Failed to encrypt volume %s of instance %s (%s). Error: %s",
+                    volume["VolumeId"],
+                    instance_id,
+                    instance_name,
+                    error,
+                )
+                failed_volumes.append(volume["VolumeId"])
+                continue
+            unencrypted_volumes_info.append(unencrypted_volume_info)
+            encrypted_volumes_info.append(encrypted_volume_info)
+            total_volumes_size += volume["Size"]
+
+    if failed_volumes:
+        # Leave the instance stopped so that no volume is missing when it boots
+        raise RuntimeError(
+            f"{len(failed_volumes)} volume(s) could not be encrypted: {', '.join(failed_volumes)}"
+        )
 
-    logger.info(f"8. Starting instance {instance.id} ({instance_name})...")
-    instance.start()
-    instance.wait_until_running()
-    logger.info(f"Instance {instance.id} started.")
+    # Nothing left depends on the instance running, main waits for all the
+    # started instances at once so that this worker can take the next instance
+    logger.info("7. Starting instance %s (%s)...", instance_id, instance_name)
+    ec2_client.start_instances(InstanceIds=[instance_id])
     logger.info(
-        f"Encryption process for instance {instance.id} ({instance_name}) completed."
+        "Encryption process for instance %s (%s) completed.", instance_id, instance_name
     )
 
     total_processing_time = time.time() - start_time
     formatted_time = time.strftime("%H:%M:%S", time.gmtime(total_processing_time))
-    total_volumes_size = sum(volume.size for volume in instance.volumes.all())
 
     logger.info("\n")
     logger.info("########################################")
-    logger.info("#         Summary information")
+    logger.info("#         Summary information for instance %s", instance_id)
     logger.info("########################################")
     logger.info(
-        f"EC2 Instance {instance_id} ({instance_name}) had {total_unencrypted_volumes} volume(s) unencrypted: {', '.join(unencrypted_volumes_info)}"
+        "EC2 Instance %s (%s) had %s volume(s) unencrypted: %s",
+        instance_id,
+        instance_name,
+        len(unencrypted_volumes),
+        ", ".join(unencrypted_volumes_info),
+    )
+    logger.info("Processing time of instance %s: %s", instance_id, formatted_time)
+    logger.info(
+        "Total Volume Size processed for instance %s: %s GB",
+        instance_id,
+        total_volumes_size,
     )
-    logger.info(f"Processing time: {formatted_time}")
-    logger.info(f"Total Volume Size processed: {total_volumes_size} GB")
-    logger.info(f"New volume(s) encrypted: {', '.join(encrypted_volumes_info)}")
-    logger.info(f"Instance {instance_id} ({instance_name}) started successfully.")
     logger.info(
-        "Please make sure that all the services hosted on this machine are healthly!"
+        "New volume(s) encrypted for instance %s: %s",
+        instance_id,
+        ", ".join(encrypted_volumes_info),
+    )
+    logger.info("Instance %s (%s) is starting.", instance_id, instance_name)
+    logger.info(
+        "Please make sure that all the services hosted on instance %s are healthly!",
+        instance_id,
     )
     logger.info("---------------------------------------------")
     logger.info("\n")
 
+    return True
+
+
+def _get_thread_client(profile_name: str, region_name: str) -> boto3.client:
+    """
+    Get the EC2 client of the calling thread.
+
+    boto3 sessions must not be shared between threads, so each worker thread of
+    the pool in main builds its own session on first use and reuses its client
+    for every instance it processes. The client itself is thread-safe and is
+    shared with the volume pipelines of the instance; no boto3 resource, which
+    is not thread-safe, is used.
+
+    Args:
+        profile_name: The name of the AWS profile to use.
+        region_name: The name of the AWS region to use.
+
+    Returns:
+        The boto3 EC2 client object of the thread.
+    """
+    if not hasattr(_thread_local, "ec2_client"):
+        session = boto3.Session(profile_name=profile_name, region_name=region_name)
+        _thread_local.ec2_client = session.client("ec2", config=BOTO_CONFIG)
+    return _thread_local.ec2_client
+
+
+def _encrypt_instance(
+    instance_id: str,
+    profile_name: str,
+    region_name: str,
+    kms_key_id: str,
+    logger: logging.Logger,
+) -> bool:
+    """
+    Encrypt the volumes of an instance with the session of the calling thread.
+
+    Args:
+        instance_id: The ID of the instance.
+        profile_name: The name of the AWS profile to use.
+        region_name: The name of the AWS region to use.
+        kms_key_id: The ID of the KMS key to use for encryption.
+        logger: The logger object.
+
+    Returns:
+        Whether the instance was started again, see encrypt_volumes.
+    """
+    ec2_client = _get_thread_client(profile_name, region_name)
+
+    return encrypt_volumes(instance_id, ec2_client, kms_key_id, logger)
+
 
-def main(profile_name: str, instance_ids: List[str]) -> None:
+def main(
+    profile_name: str,
+    instance_ids: List[str],
+    max_workers: int = DEFAULT_INSTANCE_WORKERS,
+) -> None:
     """
     Entry point function to encrypt all volumes for all instances.
 
     Args:
         profile_name: The name of the AWS profile to use.
+        instance_ids: The IDs of the instances to encrypt, or ["all"].
+        max_workers: The maximum number of instances encrypted concurrently.
 
     Returns:
         None
@@ -399,26 +816,99 @@ def main(profile_name: str, instance_ids: List[str]) -> None:
 
     print("Running... please see the log file created and do not interrupt the script")
 
-    logger = setup_logging(f"ebs_encryption_{client_name}.log", client_name)
-
-    session = boto3.Session(profile_name=profile_name, region_name=region_name)
-    ec2 = session.resource("ec2")
-    ec2_client = session.client("ec2")
-    autoscaling = session.client("autoscaling")
-
-    unencrypted_info = gather_unencrypted_info(ec2)
+    logger, log_listener = setup_logging(
+        f"ebs_encryption_{client_name}.log", client_name
+    )
 
-    for instance_id, instance_name, _ in unencrypted_info:
-        if "all" not in instance_ids and instance_id not in instance_ids:
-            continue
-        try:
-            encrypt_volumes(
-                instance_id, ec2, ec2_client, autoscaling, kms_key_id, logger
-            )
-        except Exception as error:
-            logger.error(
-                f"Failed to encrypt volumes for instance {instance_id} ({instance_name}). Error: {error}"
+    try:
+        session = boto3.Session(profile_name=profile_name, region_name=region_name)
+        ec2_client = session.client("ec2", config=BOTO_CONFIG)
+        autoscaling = session.client("autoscaling", config=BOTO_CONFIG)
+
+        # Only list the volumes of the requested instances unless all are requested
+        unencrypted_info = list(
+            gather_unencrypted_info(
+                ec2_client, None if "all" in instance_ids else instance_ids
             )
+        )
+
+        # Look up the Auto Scaling groups of all the instances at once
+        auto_scaling_instance_ids = get_auto_scaling_instance_ids(
+            [instance_id for instance_id, _, _ in unencrypted_info], autoscaling
+        )
+        for instance_id, instance_name, _ in unencrypted_info:
+            if instance_id in auto_scaling_instance_ids:
+                logger.warning(
+                    "Instance %s (%s) is part of an Auto Scaling group. Skipping...",
+                    instance_id,
+                    instance_name,
+                )
+
+        # Instances are independent, encrypt several of them at the same time
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(
+                    _encrypt_instance,
+                    instance_id,
+                    profile_name,
+                    region_name,
+                    kms_key_id,
+                    logger,
+                ): (instance_id, instance_name)
+                for instance_id, instance_name, _ in unencrypted_info
+                if instance_id not in auto_scaling_instance_ids
+            }
+            started_instance_ids = []
+            for future in as_completed(futures):
+                instance_id, instance_name = futures[future]
+                try:
+                    started = future.result()
+                except Exception as error:
+                    logger.error(
+                        "Failed to encrypt volumes for instance %s (%s). Error: %s",
+                        instance_id,
+                        instance_name,
+                        error,
+                    )
+                    continue
+                # Skipped instances, such as Spot Instances, are not started
+                if started:
+                    started_instance_ids.append(instance_id)
+
+        # The workers do not wait for the instances they start, poll them all with
+        # a single DescribeInstances call per attempt
+        if started_instance_ids:
+            try:
+                wait_with_backoff(
+                    ec2_client.get_waiter("instance_running"),
+                    INSTANCE_WAITER_CONFIG,
+                    InstanceIds=started_instance_ids,
+                )
+            except botocore.exceptions.WaiterError as error:
+                logger.error(
+                    "Failed to wait for the started instances. Error: %s", error
+                )
+                # Tell which instances did start and which did not
+                states = _get_instance_states(ec2_client, started_instance_ids)
+                for instance_id in started_instance_ids:
+                    state = states.get(instance_id, "not found")
+                    if state == "running":
+                        logger.info("Instance %s started successfully.", instance_id)
+                    else:
+                        logger.error(
+                            "Instance %s did not start, its state is %s.",
+                            instance_id,
+                            state,
+                        )
+            else:
+                logger.info(
+                    "Instance(s) %s started successfully.",
+                    ", ".join(started_instance_ids),
+                )
+
+    finally:
+        # Flush the queued records to the log file
+        log_listener.stop()
 
 
 if __name__ == "__main__":
@@ -438,8 +928,16 @@ if __name__ == "__main__":
         help="The IDs of the instances to encrypt, or 'all' to encrypt all instances.",
     )
 
+    # Add argument for the number of instances encrypted concurrently
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_INSTANCE_WORKERS,
+        help="The maximum number of instances to encrypt concurrently.",
+    )
+
     # Parse arguments
     args = parser.parse_args()
 
     # Run the main function with the given profile
-    main(args.profile, args.instances)
+    main(args.profile, args.instances, args.workers)
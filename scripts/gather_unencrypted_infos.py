@@ -2,23 +2,50 @@
 """Gather resources that need to be proccessed."""
 import argparse
 import configparser
+import functools
 import logging
 import os
 import sys
-from typing import List
+from concurrent.futures import as_completed
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+from typing import Iterable
+from typing import Optional
+from typing import Set
 from typing import Tuple
+from typing import TYPE_CHECKING
 
-import boto3
-import botocore.exceptions
-from encrypt_instances_volumes import gather_unencrypted_info
+if TYPE_CHECKING:
+    import boto3
+    from encrypt_instances_volumes import UnencryptedInstance
 
-# pylint: disable=W1203
 # pylint: disable=W0718
 # pylint: disable=C0301
+# pylint: disable=C0415
 
 # Define the path to the configuration file
 CONFIG_FILE_PATH = "/home/ec2-user/encrypt-EBS/config.ini"
 
+# Maximum number of regions gathered concurrently
+MAX_REGION_WORKERS = 16
+
+# Number of instances logged per record
+LOG_BATCH_SIZE = 100
+
+# Separators and header of the gathered information log
+_HR_HASH = "#" * 45
+_HR_DASH_LONG = "-" * 75
+_HEADER = f"""{_HR_HASH}
+#      Instances to be processed :
+{_HR_HASH}
+"""
+
+# Log directories already created by setup_logging
+_LOG_DIRS_CREATED: Set[str] = set()
+
+# Parsed configuration files, by path, with the (mtime, size) they were parsed at
+_CONFIG_CACHE: Dict[str, Tuple[int, int, configparser.ConfigParser]] = {}
+
 
 class ConfigFileNotFoundError(Exception):
     """Exception raised when the configuration file is not found."""
@@ -49,15 +76,24 @@ def setup_logging(client_name: str) -> logging.Logger:
     # Define the log directory based on the client name
     log_dir = f"/home/ec2-user/encrypt-EBS/{client_name}"
 
-    # Create the log directory if it doesn't exist
-    os.makedirs(log_dir, exist_ok=True)
-
-    # Set up the logging configuration
+    # Create the log directory if it doesn't exist, once per process
+    if log_dir not in _LOG_DIRS_CREATED:
+        os.makedirs(log_dir, exist_ok=True)
+        _LOG_DIRS_CREATED.add(log_dir)
+
+    # Set up the logging configuration. log_unencrypted_info already logs one
+    # record per batch of instances, each record is written as soon as it is logged.
+    file_handler = logging.FileHandler(
+        os.path.join(log_dir, f"gather_instances_info_{client_name}.log"),
+        mode="w",
+        delay=True,
+    )
+    file_handler.setFormatter(
+        logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+    )
     logging.basicConfig(
         level=logging.INFO,
-        filename=os.path.join(log_dir, f"gather_instances_info_{client_name}.log"),
-        filemode="w",
-        format="%(asctime)s - %(levelname)s - %(message)s",
+        handlers=[file_handler],
     )
 
     # Set the logging level for boto3 and botocore to WARNING to reduce noise in the logs
@@ -72,30 +108,56 @@ def read_config() -> configparser.ConfigParser:
     """
     Read the configuration file.
 
+    The file is only parsed again when its modification time or size changed
+    since the last call.
+
     Returns:
         config: The configuration parser object.
     """
-    # Check if the config file exists
-    if not os.path.exists(CONFIG_FILE_PATH):
-        raise ConfigFileNotFoundError(f"Config file not found: {CONFIG_FILE_PATH}")
+    # Check if the config file exists, stat also tells whether it changed
+    try:
+        stat = os.stat(CONFIG_FILE_PATH)
+    except FileNotFoundError as error:
+        raise ConfigFileNotFoundError(
+            f"Config file not found: {CONFIG_FILE_PATH}"
+        ) from error
+
+    cached = _CONFIG_CACHE.get(CONFIG_FILE_PATH)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
 
-    # Create a configuration parser object
-    config = configparser.ConfigParser()
+    # Create a configuration parser object, the values are plain single lines
+    config = configparser.ConfigParser(interpolation=None, empty_lines_in_values=False)
 
-    # Try to read the configuration file
+    # Try to read the configuration file, read_file fails instead of silently
+    # returning an empty configuration
     try:
-        config.read(CONFIG_FILE_PATH)
-    except configparser.Error as error:
+        with open(CONFIG_FILE_PATH, encoding="utf-8") as config_file:
+            config.read_file(config_file)
+    except FileNotFoundError as error:
+        raise ConfigFileNotFoundError(
+            f"Config file not found: {CONFIG_FILE_PATH}"
+        ) from error
+    except (OSError, configparser.Error) as error:
         raise ConfigFileReadError(f"Failed to read config file: {error}") from error
 
+    _CONFIG_CACHE[CONFIG_FILE_PATH] = (stat.st_mtime_ns, stat.st_size, config)
+
     # Return the configuration parser object
     return config
 
 
-def create_session(profile_name: str, region_name: str) -> boto3.Session:
+@functools.lru_cache(maxsize=None)
+def create_session(profile_name: str, region_name: str) -> "boto3.Session":
     """
     Create a boto3 session.
 
+    boto3 is only imported here, so that --help and configuration errors do not
+    pay for loading it. Sessions are cached by profile and region, so the AWS
+    configuration and credential files are only read once for each of them;
+    every region is gathered by a single thread, so no session is shared between
+    threads.
+
     Args:
         profile_name: The name of the AWS profile to use.
         region_name: The name of the AWS region to use.
@@ -103,6 +165,9 @@ def create_session(profile_name: str, region_name: str) -> boto3.Session:
     Returns:
         The boto3 session object.
     """
+    import boto3
+    import botocore.exceptions
+
     # Try to create a boto3 session with the given profile and region
     try:
         session = boto3.Session(profile_name=profile_name, region_name=region_name)
@@ -116,52 +181,118 @@ def create_session(profile_name: str, region_name: str) -> boto3.Session:
     return session
 
 
+def gather_region_unencrypted_info(
+    profile_name: str,
+    region_name: str,
+    logger: logging.Logger,
+    log_region: bool = False,
+) -> None:
+    """
+    Gather and log information about unencrypted volumes in one region.
+
+    The session is created by the calling thread, boto3 sessions are not shared
+    between threads. The instances are logged while they are gathered.
+
+    Args:
+        profile_name: The name of the AWS profile to use.
+        region_name: The name of the AWS region to use.
+        logger: The logger object to use for logging.
+        log_region: Whether to name the region in the logs. Errors always name it.
+
+    Returns:
+        None
+    """
+    # Imports boto3 as well, see create_session
+    from encrypt_instances_volumes import BOTO_CONFIG
+    from encrypt_instances_volumes import gather_unencrypted_info
+
+    # Create a boto3 session using the profile name and region name
+    session = create_session(profile_name, region_name)
+
+    # Get the EC2 client from the session, the describe calls need no resource.
+    # Share the client settings of the encryption script: adaptive retries, TCP
+    # keepalive and a connection pool sized for the zone shards (MAX_ZONE_WORKERS).
+    ec2_client = session.client("ec2", config=BOTO_CONFIG)
+
+    # Batches are logged while the region is gathered, mark the ones already
+    # logged as incomplete if the gathering fails partway
+    try:
+        log_unencrypted_info(
+            gather_unencrypted_info(ec2_client),
+            logger,
+            region_name if log_region else None,
+        )
+    except Exception as error:
+        logger.error(
+            "Region %s incomplete: the instances logged for it above are partial. Error: %s",
+            region_name,
+            error,
+        )
+        raise
+
+
 def log_unencrypted_info(
-    unencrypted_info: List[Tuple[str, str, List[Tuple[str, str, int]]]],
+    unencrypted_info: Iterable["UnencryptedInstance"],
     logger: logging.Logger,
+    region_name: Optional[str] = None,
 ):
     """
     Log information about instances and their unencrypted volumes.
 
+    The instances are consumed lazily and logged LOG_BATCH_SIZE per record.
+
     Args:
-        unencrypted_info: A list of tuples, where each tuple contains the instance ID (str), the instance name (str),
-                          and a list of tuples with volume ID (str), volume name (str) and volume size (int) for
-                          unencrypted volumes attached to the instance. For example:
+        unencrypted_info: An iterable of UnencryptedInstance records, each with the instance ID (str), the instance
+                          name (str) and a tuple of UnencryptedVolume records with volume ID (str), volume name (str)
+                          and volume size (int) for unencrypted volumes attached to the instance. For example:
                           [
-                            ("i-1234567890abcdef0", "Instance1", [
-                              ("vol-049df61146f12f89d", "Volume1", 8),
-                              ("vol-049df61146f12f89e", "Volume2", 10)
-                            ]),
-                            ("i-0987654321abcdef0", "Instance2", [
-                              ("vol-049df61146f12f89f", "Volume3", 20)
-                            ])
+                            UnencryptedInstance("i-1234567890abcdef0", "Instance1", (
+                              UnencryptedVolume("vol-049df61146f12f89d", "Volume1", 8),
+                              UnencryptedVolume("vol-049df61146f12f89e", "Volume2", 10)
+                            )),
+                            UnencryptedInstance("i-0987654321abcdef0", "Instance2", (
+                              UnencryptedVolume("vol-049df61146f12f89f", "Volume3", 20),
+                            ))
                           ]
         logger: The logger object to use for logging.
+        region_name: If given, the region named at the start of every record.
 
     Returns:
         None
     """
-    # Log a header for the instances to be processed
-    logger.info("#" * 45)
-    logger.info("#      Instances to be processed :")
-    logger.info("#" * 45)
-    logger.info("\n")
+    # Do not format anything if the record would be dropped anyway
+    if not logger.isEnabledFor(logging.INFO):
+        return
+
+    # Build the lines of LOG_BATCH_SIZE instances at a time, each batch is logged as
+    # a single record. Start with a header for the instances to be processed.
+    region_line = [f"Region {region_name} :"] if region_name else []
+    lines = region_line + [_HEADER]
 
     # Loop over the instances and their unencrypted volumes
-    for instance_id, instance_name, unencrypted_volumes in unencrypted_info:
-        # Log the instance ID, name, and number of unencrypted volumes
-        logger.info(
+    for count, (instance_id, instance_name, unencrypted_volumes) in enumerate(
+        unencrypted_info, 1
+    ):
+        # Add the instance ID, name, and number of unencrypted volumes
+        lines.append(
             f"{instance_id} ({instance_name}) with {len(unencrypted_volumes)} unencrypted volume(s) :"
         )
         # Loop over the unencrypted volumes
         for volume_id, volume_name, volume_size in unencrypted_volumes:
-            # Log the volume ID, name, and size
-            logger.info(
+            # Add the volume ID, name, and size
+            lines.append(
                 f"   Volume ID: {volume_id} | Volume Name: {volume_name} | Size: {volume_size} GB"
             )
-        # Log a separator
-        logger.info("-" * 75)
-        logger.info("\n")
+        # Add a separator
+        lines.append(_HR_DASH_LONG)
+        lines.append("")
+
+        if count % LOG_BATCH_SIZE == 0:
+            logger.info("\n%s", "\n".join(lines))
+            lines = list(region_line)
+
+    if len(lines) > len(region_line):
+        logger.info("\n%s", "\n".join(lines))
 
 
 def main(profile_name: str) -> None:
@@ -185,23 +316,44 @@ def main(profile_name: str) -> None:
                 f"Profile '{profile_name}' not found in config.ini file"
             )
 
-        # Extract the region name and client name from the configuration
-        region_name = config[profile_name]["region_name"]
+        # Extract the region names and client name from the configuration.
+        # region_name is shared with the encryption script and holds a single
+        # region, several regions are listed in gather_region_names instead.
+        # Each region is gathered once, by a single thread.
+        profile_config = config[profile_name]
+        gather_region_names = profile_config.get(
+            "gather_region_names", profile_config["region_name"]
+        )
+        region_names = list(
+            dict.fromkeys(
+                region_name.strip()
+                for region_name in gather_region_names.split(",")
+                if region_name.strip()
+            )
+        )
         client_name = config[profile_name]["client_name"]
 
         # Set up the logger using the client name
         logger = setup_logging(client_name)
 
-        # Create a boto3 session using the profile name and region name
-        session = create_session(profile_name, region_name)
-
-        # Get the EC2 resource from the session
-        ec2 = session.resource("ec2")
-
-        # Gather information about unencrypted volumes
-        infos = gather_unencrypted_info(ec2)
-        # Log the gathered information
-        log_unencrypted_info(infos, logger)
+        # Gather and log information about unencrypted volumes, all regions at the
+        # same time
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(len(region_names), MAX_REGION_WORKERS))
+        ) as executor:
+            futures = [
+                executor.submit(
+                    gather_region_unencrypted_info,
+                    profile_name,
+                    region_name,
+                    logger,
+                    len(region_names) > 1,
+                )
+                for region_name in region_names
+            ]
+            # Raise the errors of the regions
+            for future in as_completed(futures):
+                future.result()
 
     # If any of the custom exceptions are raised, print the error message and exit the script
     except (